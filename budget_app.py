@@ -1,10 +1,14 @@
 import streamlit as st
-import json
+import functools
 import os
-import csv
+import sqlite3
+from collections import defaultdict
 from datetime import datetime
-from io import StringIO
+from io import BytesIO
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 
 # Page config
 st.set_page_config(
@@ -16,37 +20,146 @@ st.set_page_config(
 
 # File paths
 CONFIG_FILE = 'budget_config.json'
-DATA_FILE = 'budget_data.json'
+DATA_FILE = 'budget_data.json'  # Legacy JSON store, migrated into DB_FILE on first run
+DB_FILE = 'budget.db'
 RULES_FILE = 'categorization_rules.json'
 
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS months (
+    month TEXT PRIMARY KEY,
+    income REAL NOT NULL,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    month TEXT NOT NULL,
+    name TEXT NOT NULL,
+    percentage NUMERIC NOT NULL,
+    allocated REAL NOT NULL,
+    spent REAL NOT NULL,
+    remaining REAL NOT NULL,
+    PRIMARY KEY (month, name)
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY,
+    month TEXT NOT NULL,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS expenses_month_date ON expenses (month, date);
+"""
+
+# Chase CSV columns we read, and transaction types that are money coming in
+CHASE_COLUMNS = {'Description', 'Details', 'Amount', 'Posting Date', 'Date', 'Type'}
+CHASE_DTYPES = {
+    'Description': str,
+    'Details': str,
+    'Amount': 'float64',
+    'Posting Date': str,
+    'Date': str,
+    'Type': str
+}
+CREDIT_TYPES = ['CREDIT', 'DEPOSIT', 'ACH_CREDIT', 'DSLIP']
+
+# Uploads larger than this are parsed with pyarrow, smaller ones with pandas
+ARROW_CSV_MIN_BYTES = 1_000_000
+
+# Rule sets at least this large are matched through a keyword prefix index
+RULE_INDEX_MIN_RULES = 128
+
+# Each month keeps its expenses as parallel columns, one list per field
+EXPENSE_FIELDS = ('date', 'category', 'amount', 'description')
+
 # Initialize session state
 if 'config' not in st.session_state:
     st.session_state.config = None
+if 'db' not in st.session_state:
+    st.session_state.db = None
 if 'data' not in st.session_state:
     st.session_state.data = None
 if 'rules' not in st.session_state:
     st.session_state.rules = None
+if 'categorizer' not in st.session_state:
+    st.session_state.categorizer = None
 
 # Load functions
+@st.cache_data(show_spinner=False)
+def _load_json(path, mtime):
+    # mtime is only part of the cache key, so edits to the file invalidate it
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
 def load_config():
     if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
+        return _load_json(CONFIG_FILE, os.path.getmtime(CONFIG_FILE))
     return {
         "categories": {},
         "fixed_expenses": {}
     }
 
+def connect_db():
+    db = sqlite3.connect(DB_FILE, isolation_level=None, check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript(DB_SCHEMA)
+    
+    # Migrate the old JSON data file into an empty database
+    if os.path.exists(DATA_FILE) and db.execute('SELECT COUNT(*) FROM months').fetchone()[0] == 0:
+        with open(DATA_FILE, 'rb') as f:
+            months = orjson.loads(f.read())["months"]
+        
+        with db:
+            db.execute('BEGIN')
+            for month, month_data in months.items():
+                insert_month(db, month, month_data)
+                insert_expenses(db, month, month_data["expenses"])
+    
+    return db
+
+@st.cache_data(show_spinner=False)
 def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    return {"months": {}}
+    # Cleared by every write to the database
+    data = {"months": {}}
+    
+    # Months come back newest first (the primary key index makes this a reverse
+    # index scan), so pages can list them without sorting
+    for month, income, created in db.execute('SELECT month, income, created FROM months ORDER BY month DESC'):
+        data["months"][month] = {
+            "created": created,
+            "budget": {
+                "total_income": income,
+                "categories": {},
+                "fixed_expenses": {},
+                "remaining_after_fixed": income,
+                "total_spent": 0
+            },
+            "expenses": new_expense_columns()
+        }
+    
+    for month, name, percentage, allocated, spent, remaining in db.execute(
+            'SELECT month, name, percentage, allocated, spent, remaining FROM categories ORDER BY rowid'):
+        budget = data["months"][month]["budget"]
+        budget["categories"][name] = {
+            "percentage": percentage,
+            "allocated": allocated,
+            "spent": spent,
+            "remaining": remaining
+        }
+        budget["total_spent"] += spent
+    
+    for month, date, category, amount, description in db.execute(
+            'SELECT month, date, category, amount, description FROM expenses ORDER BY id'):
+        columns = data["months"][month]["expenses"]
+        columns["date"].append(date)
+        columns["category"].append(category)
+        columns["amount"].append(amount)
+        columns["description"].append(description)
+    
+    return data
 
 def load_rules():
     if os.path.exists(RULES_FILE):
-        with open(RULES_FILE, 'r') as f:
-            return json.load(f)
+        return _load_json(RULES_FILE, os.path.getmtime(RULES_FILE))
     return {
         "keyword_rules": {
             "WHOLE FOODS": "Necessities",
@@ -64,38 +177,218 @@ def load_rules():
         "learned_rules": {}
     }
 
+def _save_json(path, obj):
+    # Write a temp file and rename it over the original, so an interrupted
+    # save can't leave a truncated file behind
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _load_json.clear()
+
 def save_config(config):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=2)
+    _save_json(CONFIG_FILE, config)
 
-def save_data(data):
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+def new_expense_columns():
+    return {field: [] for field in EXPENSE_FIELDS}
+
+def append_expenses(columns, expenses):
+    """Append expense records to a month's expense columns"""
+    for field in EXPENSE_FIELDS:
+        columns[field].extend(e[field] for e in expenses)
+
+def insert_month(conn, month, month_data):
+    conn.execute(
+        'INSERT INTO months (month, income, created) VALUES (?, ?, ?)',
+        (month, month_data["budget"]["total_income"], month_data["created"])
+    )
+    conn.executemany(
+        'INSERT INTO categories (month, name, percentage, allocated, spent, remaining) VALUES (?, ?, ?, ?, ?, ?)',
+        [(month, name, cat["percentage"], cat["allocated"], cat["spent"], cat["remaining"])
+         for name, cat in month_data["budget"]["categories"].items()]
+    )
+
+def insert_expenses(conn, month, expenses):
+    conn.executemany(
+        'INSERT INTO expenses (month, date, category, amount, description) VALUES (?, ?, ?, ?, ?)',
+        [(month, e["date"], e["category"], e["amount"], e["description"]) for e in expenses]
+    )
+
+def save_month(month, month_data):
+    """Create a month's budget, replacing any existing budget for that month"""
+    with db:
+        db.execute('BEGIN')
+        for table in ('expenses', 'categories', 'months'):
+            db.execute(f'DELETE FROM {table} WHERE month = ?', (month,))
+        insert_month(db, month, month_data)
+    load_data.clear()
+    # A recreated month restarts its expense count, which would hit stale entries
+    recent_expenses_frame.clear()
+
+def add_expenses(month, expenses):
+    """Record expenses for a month and charge them to their categories"""
+    with db:
+        db.execute('BEGIN')
+        insert_expenses(db, month, expenses)
+        
+        totals = defaultdict(float)
+        for e in expenses:
+            totals[e["category"]] += e["amount"]
+        db.executemany(
+            'UPDATE categories SET spent = spent + ?, remaining = remaining - ? WHERE month = ? AND name = ?',
+            [(total, total, month, category) for category, total in totals.items()]
+        )
+    load_data.clear()
+
+def recent_expenses(month, limit=10):
+    """Most recent expenses for a month, newest first"""
+    return db.execute(
+        'SELECT date, category, description, amount FROM expenses WHERE month = ? ORDER BY date DESC LIMIT ?',
+        (month, limit)
+    ).fetchall()
+
+@st.cache_data(show_spinner=False)
+def recent_expenses_frame(month, expense_count):
+    """Display table of a month's 10 most recent expenses"""
+    # expense_count is only part of the cache key, so new expenses refresh the table
+    expenses_df = pd.DataFrame(recent_expenses(month), columns=['date', 'category', 'description', 'amount'])
+    expenses_df['date'] = pd.to_datetime(expenses_df['date']).dt.strftime('%m/%d/%Y %H:%M')
+    expenses_df['amount'] = expenses_df['amount'].apply(lambda x: f"${x:.2f}")
+    return expenses_df
 
 def save_rules(rules):
-    with open(RULES_FILE, 'w') as f:
-        json.dump(rules, f, indent=2)
+    _save_json(RULES_FILE, rules)
+
+@st.cache_resource(show_spinner=False)
+def compile_rules(rules):
+    """Build a memoized categorizer for the rules, learned rules first"""
+    # Cached on the rules' contents, so keywords are upper-cased once per rule
+    # change rather than on every rerun or import
+    keywords = tuple(
+        (keyword.upper(), category)
+        for keyword, category in [*rules["learned_rules"].items(), *rules["keyword_rules"].items()]
+    )
+    # Large rule sets are indexed by each keyword's first two characters, so a
+    # description only checks keywords that can start at each of its positions
+    prefix_index = None
+    if len(keywords) >= RULE_INDEX_MIN_RULES and all(len(keyword) >= 2 for keyword, _ in keywords):
+        prefix_index = defaultdict(list)
+        for index, (keyword, category) in enumerate(keywords):
+            prefix_index[keyword[:2]].append((index, keyword, category))
+        prefix_index = dict(prefix_index)
+    
+    # The memo belongs to this rule set, so a hit only hashes the description
+    # and a rule change starts with an empty one
+    return functools.lru_cache(maxsize=4096)(
+        functools.partial(auto_categorize, matcher=(keywords, prefix_index))
+    )
 
-def auto_categorize(description, rules):
+def auto_categorize(description, matcher):
     """Auto-categorize transaction based on description"""
+    keywords, prefix_index = matcher
     description_upper = description.upper()
     
-    # Check learned rules first
-    for merchant, category in rules["learned_rules"].items():
-        if merchant.upper() in description_upper:
-            return category
-    
-    # Check keyword rules
-    for keyword, category in rules["keyword_rules"].items():
-        if keyword.upper() in description_upper:
-            return category
-    
-    return None
+    # First rule in priority order wins
+    if prefix_index is None:
+        for keyword, category in keywords:
+            if keyword in description_upper:
+                return category
+        return None
+    
+    # Same result via the index: the lowest-priority-index keyword found anywhere
+    best = None
+    for pos in range(len(description_upper) - 1):
+        for index, keyword, category in prefix_index.get(description_upper[pos:pos + 2], ()):
+            if (best is None or index < best[0]) and description_upper.startswith(keyword, pos):
+                best = (index, category)
+    return best[1] if best else None
+
+def read_csv_arrow(raw):
+    """Parse CSV bytes with pyarrow's multi-threaded reader, or None if it can't"""
+    try:
+        table = pa_csv.read_csv(
+            BytesIO(raw),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=sorted(CHASE_COLUMNS),
+                include_missing_columns=True,
+                column_types={name: pa.string() for name in CHASE_COLUMNS}
+            )
+        )
+    except pa.ArrowInvalid:
+        # e.g. the trailing comma on Chase checking exports, which pandas tolerates
+        return None
+    
+    # Present columns keep empty strings, so an all-null column was missing from the file
+    missing = [name for name in table.column_names if table[name].null_count == table.num_rows]
+    return table.drop_columns(missing).to_pandas()
+
+def read_chase_csv(uploaded_file):
+    """Parse a Chase CSV export into a DataFrame of expense transactions"""
+    raw = uploaded_file.getvalue()
+    df = read_csv_arrow(raw) if len(raw) > ARROW_CSV_MIN_BYTES else None
+    
+    if df is None:
+        # index_col=False keeps Chase's trailing comma from shifting columns
+        read_options = dict(
+            engine='c',
+            usecols=lambda c: c in CHASE_COLUMNS,
+            keep_default_na=False,
+            index_col=False,
+            low_memory=False
+        )
+        try:
+            # Declared types let the parser skip inference on every column
+            df = pd.read_csv(
+                BytesIO(raw),
+                dtype=CHASE_DTYPES,
+                na_values={'Amount': ['']},
+                thousands=',',
+                **read_options
+            )
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=['description', 'amount', 'date'])
+        except ValueError:
+            # Some Amount isn't a number; read it as text and coerce it below
+            df = pd.read_csv(BytesIO(raw), dtype=str, **read_options)
+    
+    def column(*names):
+        for name in names:
+            if name in df:
+                return df[name]
+        return pd.Series('', index=df.index, dtype=object)
+    
+    description = column('Description', 'Details')
+    date = column('Posting Date', 'Date')
+    amount = column('Amount')
+    if not pd.api.types.is_float_dtype(amount):
+        amount = pd.to_numeric(amount.str.replace(',', '', regex=False), errors='coerce')
+    trans_type = column('Type').str.upper()
+    
+    # Skip deposits/credits and rows without a description or a valid amount
+    mask = (amount < 0) & ~trans_type.isin(CREDIT_TYPES) & (description != '')
+    
+    return pd.DataFrame({
+        'description': description[mask],
+        'amount': amount[mask].abs(),
+        'date': date[mask]
+    })
+
+def expense_keys(expenses):
+    """Duplicate-detection keys: upper-cased description plus amount to the cent"""
+    return (expenses['description'].astype(str).str.upper() + '|' +
+            expenses['amount'].astype(float).round(2).astype(str))
 
 # Load data
+if st.session_state.db is None:
+    st.session_state.db = connect_db()
+db = st.session_state.db
+
 st.session_state.config = load_config()
 st.session_state.data = load_data()
 st.session_state.rules = load_rules()
+st.session_state.categorizer = compile_rules(st.session_state.rules)
 
 # Custom CSS
 st.markdown("""
@@ -131,7 +424,7 @@ if page == "📊 Dashboard":
     current_month = datetime.now().strftime("%Y-%m")
     
     # Month selector
-    available_months = sorted(st.session_state.data["months"].keys(), reverse=True)
+    available_months = list(st.session_state.data["months"])
     if available_months:
         selected_month = st.selectbox("Select Month", available_months, index=0)
     else:
@@ -148,7 +441,7 @@ if page == "📊 Dashboard":
         st.metric("💵 Total Income", f"${budget['total_income']:,.2f}")
     
     with col2:
-        total_spent = sum(cat["spent"] for cat in budget["categories"].values())
+        total_spent = budget["total_spent"]
         st.metric("💸 Total Spent", f"${total_spent:,.2f}")
     
     with col3:
@@ -186,13 +479,8 @@ if page == "📊 Dashboard":
     # Recent transactions
     st.subheader("Recent Transactions")
     
-    if month_data["expenses"]:
-        expenses_df = pd.DataFrame(month_data["expenses"])
-        expenses_df['date'] = pd.to_datetime(expenses_df['date']).dt.strftime('%m/%d/%Y %H:%M')
-        expenses_df = expenses_df[['date', 'category', 'description', 'amount']]
-        expenses_df = expenses_df.sort_values('date', ascending=False).head(10)
-        expenses_df['amount'] = expenses_df['amount'].apply(lambda x: f"${x:.2f}")
-        
+    if month_data["expenses"]["date"]:
+        expenses_df = recent_expenses_frame(selected_month, len(month_data["expenses"]["date"]))
         st.dataframe(expenses_df, use_container_width=True, hide_index=True)
     else:
         st.info("No expenses recorded yet.")
@@ -219,61 +507,20 @@ elif page == "📥 Import CSV":
     uploaded_file = st.file_uploader("Upload Chase CSV", type=['csv'])
     
     if uploaded_file is not None:
-        # Read CSV
-        stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
-        csv_reader = csv.DictReader(stringio)
+        transactions = read_chase_csv(uploaded_file)
         
-        transactions = []
-        for row in csv_reader:
-            description = row.get('Description', row.get('Details', ''))
-            amount_str = row.get('Amount', '0')
-            date_str = row.get('Posting Date', row.get('Date', ''))
-            trans_type = row.get('Type', '').upper()
-            
-            if not description:
-                continue
-            
-            try:
-                amount_raw = float(amount_str.replace(',', ''))
-            except ValueError:
-                continue
-            
-            # Skip deposits/credits
-            if amount_raw >= 0:
-                continue
-            
-            if trans_type in ['CREDIT', 'DEPOSIT', 'ACH_CREDIT', 'DSLIP']:
-                continue
-            
-            amount = abs(amount_raw)
-            
-            transactions.append({
-                'description': description,
-                'amount': amount,
-                'date': date_str
-            })
-        
-        if not transactions:
+        if transactions.empty:
             st.warning("No valid transactions found in CSV (income/deposits automatically filtered out)")
             st.stop()
         
         # Check for duplicates
-        existing_expenses = st.session_state.data["months"][current_month]["expenses"]
-        duplicates = []
-        new_transactions = []
+        existing = pd.DataFrame(st.session_state.data["months"][current_month]["expenses"])
+        keys = expense_keys(transactions)
         
-        for trans in transactions:
-            is_duplicate = False
-            for existing in existing_expenses:
-                if (existing.get('description', '').upper() == trans['description'].upper() and
-                    abs(existing.get('amount', 0) - trans['amount']) < 0.01):
-                    is_duplicate = True
-                    break
-            
-            if is_duplicate:
-                duplicates.append(trans)
-            else:
-                new_transactions.append(trans)
+        # Repeats within the CSV itself count as duplicates too
+        dup_mask = keys.isin(set(expense_keys(existing))) | keys.duplicated()
+        duplicates = transactions[dup_mask].to_dict('records')
+        new_transactions = transactions[~dup_mask].to_dict('records')
         
         # Display results
         st.success(f"Found {len(transactions)} expense transactions in CSV")
@@ -289,46 +536,56 @@ elif page == "📥 Import CSV":
         if duplicates:
             st.warning(f"⚠️ Found {len(duplicates)} duplicate transactions (will skip)")
             with st.expander("View Duplicates"):
-                for dup in duplicates[:10]:
-                    st.text(f"{dup['description'][:50]} - ${dup['amount']:.2f}")
+                st.text('\n'.join(f"{dup['description'][:50]} - ${dup['amount']:.2f}" for dup in duplicates[:10]))
         
         if new_transactions:
             st.info(f"Ready to import {len(new_transactions)} new transactions")
             
             if st.button("🚀 Import New Transactions", type="primary"):
-                imported = 0
+                imported = []
+                category_totals = defaultdict(float)
                 
                 progress_bar = st.progress(0)
                 status_text = st.empty()
+                categorize = st.session_state.categorizer
+                categories = [categorize(trans['description']) for trans in new_transactions]
+                progress_step = max(1, len(new_transactions) // 50)
+                # One timestamp for the whole batch
+                imported_at = datetime.now().isoformat()
                 
-                for i, trans in enumerate(new_transactions):
-                    category = auto_categorize(trans['description'], st.session_state.rules)
-                    
+                for i, (trans, category) in enumerate(zip(new_transactions, categories)):
                     if category and category in st.session_state.config["categories"]:
                         # Add expense
                         expense = {
-                            "date": datetime.now().isoformat(),
+                            "date": imported_at,
                             "category": category,
                             "amount": trans['amount'],
                             "description": trans['description']
                         }
                         
-                        st.session_state.data["months"][current_month]["expenses"].append(expense)
-                        st.session_state.data["months"][current_month]["budget"]["categories"][category]["spent"] += trans['amount']
-                        st.session_state.data["months"][current_month]["budget"]["categories"][category]["remaining"] -= trans['amount']
-                        
-                        imported += 1
+                        imported.append(expense)
+                        category_totals[category] += trans['amount']
                     
-                    progress_bar.progress((i + 1) / len(new_transactions))
-                    status_text.text(f"Importing {i + 1}/{len(new_transactions)}...")
+                    # Only redraw the progress widgets every ~2% of the batch
+                    if (i + 1) % progress_step == 0 or i + 1 == len(new_transactions):
+                        progress_bar.progress((i + 1) / len(new_transactions))
+                        status_text.text(f"Importing {i + 1}/{len(new_transactions)}...")
+                
+                # Apply the batch to the budget once per category
+                month_data = st.session_state.data["months"][current_month]
+                append_expenses(month_data["expenses"], imported)
+                for category, total in category_totals.items():
+                    month_data["budget"]["categories"][category]["spent"] += total
+                    month_data["budget"]["categories"][category]["remaining"] -= total
+                    month_data["budget"]["total_spent"] += total
                 
-                save_data(st.session_state.data)
+                add_expenses(current_month, imported)
                 
-                st.success(f"✅ Imported {imported} transactions!")
+                st.success(f"✅ Imported {len(imported)} transactions!")
                 st.balloons()
                 
-                if imported < len(new_transactions):
-                    st.warning(f"{len(new_transactions) - imported} transactions couldn't be auto-categorized. Add them manually in 'Add Expense' page.")
+                if len(imported) < len(new_transactions):
+                    st.warning(f"{len(new_transactions) - len(imported)} transactions couldn't be auto-categorized. Add them manually in 'Add Expense' page.")
         else:
             st.info("All transactions already imported!")
 
@@ -362,11 +619,12 @@ elif page == "➕ Add Expense":
                 "description": description
             }
             
-            st.session_state.data["months"][current_month]["expenses"].append(expense)
+            append_expenses(st.session_state.data["months"][current_month]["expenses"], [expense])
             st.session_state.data["months"][current_month]["budget"]["categories"][category]["spent"] += amount
             st.session_state.data["months"][current_month]["budget"]["categories"][category]["remaining"] -= amount
+            st.session_state.data["months"][current_month]["budget"]["total_spent"] += amount
             
-            save_data(st.session_state.data)
+            add_expenses(current_month, [expense])
             
             st.success(f"✅ Added ${amount:.2f} to {category}")
             st.balloons()
@@ -444,7 +702,8 @@ elif page == "📅 New Month":
                     "total_income": income,
                     "categories": {},
                     "fixed_expenses": {},
-                    "remaining_after_fixed": income
+                    "remaining_after_fixed": income,
+                    "total_spent": 0
                 }
                 
                 for category, details in st.session_state.config["categories"].items():
@@ -459,10 +718,10 @@ elif page == "📅 New Month":
                 st.session_state.data["months"][month] = {
                     "created": datetime.now().isoformat(),
                     "budget": budget,
-                    "expenses": []
+                    "expenses": new_expense_columns()
                 }
                 
-                save_data(st.session_state.data)
+                save_month(month, st.session_state.data["months"][month])
                 
                 st.success(f"✅ Created budget for {month} with ${income:,.2f} income!")
                 st.balloons()
@@ -493,9 +752,9 @@ elif page == "📈 Summary":
     # Month by month
     st.subheader("Month by Month")
     
-    for month in sorted(st.session_state.data["months"].keys(), reverse=True):
-        budget = st.session_state.data["months"][month]["budget"]
-        total_spent = sum(cat["spent"] for cat in budget["categories"].values())
+    for month, month_data in st.session_state.data["months"].items():
+        budget = month_data["budget"]
+        total_spent = budget["total_spent"]
         
         with st.expander(f"{month} - Income: ${budget['total_income']:,.2f}"):
             col1, col2, col3 = st.columns(3)